@@ -4,205 +4,521 @@ Provides functionality for direct S3 access and downloaded or local files.
 """
 
 # Standard imports
-from functools import reduce
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing
+import os
+import threading
 
 # Third-party imports
 import fsspec
+import h5py
 from netCDF4 import Dataset
 import numpy as np
 
-def compare_netcdfs_dl(nc_files, downloads_dir, logger):
-    """Compare NetCDFs that have been downloaded."""
+# Constants
+MAX_WORKERS = 32
+S3_WORKERS = 4    # Each S3 worker holds both granules in memory
+VAR_WORKERS = 8
+MIN_VAR_THREADS = 4    # Compare files with fewer variables serially
+STREAM_BYTES = 64 << 20    # Read size for variables that are not chunked
+S3_RANGE_SIZE = 8 << 20    # Size of S3 byte-range requests
+CHUNK_CACHE_BYTES = 64 << 20    # Maximum HDF5 chunk cache per variable
+CHUNK_CACHE_SLOTS = 1009    # Prime number of chunk cache hash slots
+PROCESS_MIN_BYTES = 50 << 20    # Mean file size to compare with processes
+REPORT_BUFFER = 256 << 10    # Buffer size for the appended NetCDF report
+
+# The netCDF-C library is not thread-safe so calls into it are serialized while
+# NumPy comparisons run concurrently
+_NC_LOCK = threading.Lock()
+
+def compare_netcdfs_dl(nc_files, downloads_dir, logger, pool="auto"):
+    """Compare NetCDFs that have been downloaded.
+    
+    Parameters
+    ----------
+    pool: str
+        How file pairs are compared concurrently: "thread", "process" or 
+        "auto" which uses processes when the mean file size is large enough
+        for decompression to dominate and threads otherwise
+    """
+    
+    if pool == "auto":
+        pool = "process" if _mean_size(nc_files, downloads_dir) >= PROCESS_MIN_BYTES else "thread"
     
     netcdf_dict = {}
-    for nc_file in nc_files:
-        logger.info(f"Comparing: {nc_file}.")
-        
-        # Open datasets
-        dev_ds = Dataset(f"{downloads_dir.joinpath('test', nc_file)}")
-        prod_ds = Dataset(f"{downloads_dir.joinpath('ops', nc_file)}")
+    test_dir = os.fspath(downloads_dir / "test")
+    ops_dir = os.fspath(downloads_dir / "ops")
+    compare_one = partial(_compare_one_dl, test_dir=test_dir, ops_dir=ops_dir,
+                          logger=logger)
+    if pool == "process":
+        logger.info(f"Comparing {len(nc_files)} granules with a process pool.")
+        log_queue = multiprocessing.Queue()
+        listener = QueueListener(log_queue, *logger.handlers, 
+                                 respect_handler_level=True)
+        listener.start()
+        try:
+            with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, _max_workers(nc_files)),
+                                     initializer=_init_worker,
+                                     initargs=(log_queue, logger.name, logger.level)) as executor:
+                for nc_file, nc_dict in executor.map(compare_one, nc_files):
+                    netcdf_dict[nc_file] = nc_dict
+        finally:
+            listener.stop()
+    else:
+        with ThreadPoolExecutor(max_workers=_max_workers(nc_files)) as executor:
+            for nc_file, nc_dict in executor.map(compare_one, nc_files):
+                netcdf_dict[nc_file] = nc_dict
         
-        # Compare
-        netcdf_dict[nc_file] = {}
-        netcdf_dict[nc_file]["dim_dict"] = {}
-        netcdf_dict[nc_file]["att_dict"] = {}
-        netcdf_dict[nc_file]["var_dict"] = {}
+    return netcdf_dict
+
+def _mean_size(nc_files, downloads_dir):
+    """Return mean size in bytes of the downloaded ops and test files."""
+    
+    if not nc_files:
+        return 0
+    env_dirs = [ os.fspath(downloads_dir / env) for env in ("ops", "test") ]
+    sizes = [ os.stat(os.path.join(env_dir, nc_file)).st_size 
+             for nc_file in nc_files for env_dir in env_dirs ]
+    return sum(sizes) / len(sizes)
+
+def _init_worker(log_queue, logger_name, log_level):
+    """Send log records from a worker process to the parent's handlers."""
+    
+    logger = logging.getLogger(logger_name)
+    logger.handlers = [QueueHandler(log_queue)]
+    logger.setLevel(log_level)
+    logger.propagate = False
+
+def _compare_one_dl(nc_file, test_dir, ops_dir, logger):
+    """Compare a single pair of downloaded NetCDFs."""
+    
+    logger.info(f"Comparing: {nc_file}.")
         
-        # Dimensions
-        netcdf_dict[nc_file]["dim_dict"] = compare_dimensions(dev_ds, prod_ds)
-        # Global Attributes
-        netcdf_dict[nc_file]["att_dict"] = compare_attributes(dev_ds, prod_ds)
-        # Variables
-        netcdf_dict[nc_file]["var_dict"] = compare_variables(dev_ds, prod_ds)
-
-        # Close open handles
+    # Open datasets
+    dev_path = os.path.join(test_dir, nc_file)
+    prod_path = os.path.join(ops_dir, nc_file)
+    _prefetch(dev_path, prod_path)
+    with _NC_LOCK:
+        dev_ds = Dataset(dev_path, mode="r")
+        prod_ds = Dataset(prod_path, mode="r")
+        dev_h5 = _open_h5(dev_path)
+        prod_h5 = _open_h5(prod_path)
+    
+    # Compare
+    h5_files = (dev_h5, prod_h5) if dev_h5 and prod_h5 else None
+    nc_dict = compare_datasets(dev_ds, prod_ds, h5_files)
+
+    # Close open handles
+    with _NC_LOCK:
         dev_ds.close()
         prod_ds.close()
+        for h5_file in (dev_h5, prod_h5):
+            if h5_file: h5_file.close()
         
-    return netcdf_dict
+    return nc_file, nc_dict
+
+def _open_h5(path):
+    """Return an h5py File for raw chunk access or None if the file is not 
+    HDF5 based."""
+    
+    try:
+        return h5py.File(path, "r")
+    except OSError:
+        return None
+
+def _prefetch(*paths):
+    """Start kernel readahead on local files so disk reads for both files
+    overlap while Dataset opens are serialized."""
+    
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
 
 def compare_netcdfs_s3(nc_files, prod_prefix, dev_prefix, s3_creds, logger):
     """Compare NetCDFs directly in S3."""
 
     netcdf_dict = {}
-    for nc_file in nc_files:        
-        logger.info(f"Comparing: {nc_file}.")
-        
-        # Open datasets
-        prod_fs = fsspec.open(f"{prod_prefix}/{nc_file}", mode="rb",
-                              key=s3_creds["ops"]["key"], secret=s3_creds["ops"]["secret"],
-                              token=s3_creds["ops"]["token"])
-        prod_file = prod_fs.open()
-        prod_ds = Dataset("prod_file", mode="r", memory=prod_file.read())
+    prod_fs = _s3_filesystem(prod_prefix, s3_creds["ops"])
+    dev_fs = _s3_filesystem(dev_prefix, s3_creds["test"])
+    compare_one = partial(_compare_one_s3, prod_prefix=prod_prefix, 
+                          dev_prefix=dev_prefix, prod_fs=prod_fs,
+                          dev_fs=dev_fs, logger=logger)
+    with ThreadPoolExecutor(max_workers=_max_workers(nc_files, S3_WORKERS)) as executor:
+        for nc_file, nc_dict in executor.map(compare_one, nc_files):
+            netcdf_dict[nc_file] = nc_dict
         
-        dev_fs = fsspec.open(f"{dev_prefix}/{nc_file}", mode="rb",
-                              key=s3_creds["test"]["key"], secret=s3_creds["test"]["secret"],
-                              token=s3_creds["test"]["token"])
-        dev_file = dev_fs.open()
-        dev_ds = Dataset("dev_file", mode="r", memory=dev_file.read())
-        
-        # Compare
-        netcdf_dict[nc_file] = {}
-        netcdf_dict[nc_file]["dim_dict"] = {}
-        netcdf_dict[nc_file]["att_dict"] = {}
-        netcdf_dict[nc_file]["var_dict"] = {}
+    return netcdf_dict
+
+def _compare_one_s3(nc_file, prod_prefix, dev_prefix, prod_fs, dev_fs, logger):
+    """Compare a single pair of NetCDFs directly in S3."""
+    
+    logger.info(f"Comparing: {nc_file}.")
         
-        # Dimensions
-        netcdf_dict[nc_file]["dim_dict"] = compare_dimensions(dev_ds, prod_ds)
-        # Global Attributes
-        netcdf_dict[nc_file]["att_dict"] = compare_attributes(dev_ds, prod_ds)
-        # Variables
-        netcdf_dict[nc_file]["var_dict"] = compare_variables(dev_ds, prod_ds)
-
-        # Close open handles
+    # Read both objects concurrently and open datasets
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        prod_read = executor.submit(_read_s3, prod_fs, f"{prod_prefix}/{nc_file}")
+        dev_read = executor.submit(_read_s3, dev_fs, f"{dev_prefix}/{nc_file}")
+        prod_bytes, dev_bytes = prod_read.result(), dev_read.result()
+    
+    with _NC_LOCK:
+        prod_ds = Dataset("prod_file", mode="r", memory=prod_bytes)
+        dev_ds = Dataset("dev_file", mode="r", memory=dev_bytes)
+    
+    # Compare
+    nc_dict = compare_datasets(dev_ds, prod_ds)
+
+    # Close open handles
+    with _NC_LOCK:
         prod_ds.close()
-        prod_file.close()
-        prod_fs.close()
         dev_ds.close()
-        dev_file.close()
-        dev_fs.close()
         
-    return netcdf_dict
+    return nc_file, nc_dict
+
+def _s3_filesystem(prefix, creds):
+    """Return a filesystem for prefix that is reused for every file in an 
+    environment so S3 clients and connections are shared."""
+    
+    s3_fs, _ = fsspec.core.url_to_fs(prefix, key=creds["key"], 
+                                     secret=creds["secret"], 
+                                     token=creds["token"])
+    return s3_fs
+
+def _read_s3(s3_fs, s3_path):
+    """Return the contents of an S3 object.
+    
+    The object is fetched as concurrent byte-range requests which are joined
+    in order.
+    """
+    
+    size = s3_fs.size(s3_path)
+    starts = list(range(0, size, S3_RANGE_SIZE))
+    ends = [min(start + S3_RANGE_SIZE, size) for start in starts]
+    parts = s3_fs.cat_ranges([s3_path] * len(starts), starts, ends, 
+                             on_error="raise")
+    return b"".join(parts)
+
+def _max_workers(nc_files, limit=MAX_WORKERS):
+    """Return number of threads to use when comparing NetCDF files."""
+    
+    return max(1, min(limit, len(nc_files)))
+
+def compare_datasets(dev_ds, prod_ds, h5_files=None):
+    """Compare dimensions, global attributes and variables between NetCDF 
+    Dataset objects.
+    
+    h5_files is an optional tuple of the dev and prod files opened with h5py 
+    which allows variables to be compared by their raw chunk bytes.
+    """
+    
+    with _NC_LOCK:
+        dim_dict = compare_dimensions(dev_ds, prod_ds)
+        att_dict = compare_attributes(dev_ds, prod_ds)
+    var_dict = compare_variables(dev_ds, prod_ds, h5_files)
+    
+    return {
+        "dim_dict": dim_dict,
+        "att_dict": att_dict,
+        "var_dict": var_dict
+    }
 
 def compare_attributes(dev_ds, prod_ds):
     """Compare NetCDF global attributes between NetCDF Dataset objects. """
 
+    # Dataset.__dict__ reads every attribute from the file so only build once
+    dev_dict = dev_ds.__dict__
+    prod_dict = prod_ds.__dict__
+    dev_keys = dev_dict.keys()
+    prod_keys = prod_dict.keys()
+
     att = { 
-        "prod_present_only": [], 
-        "dev_present_only": [], 
+        "prod_present_only": sorted(prod_keys - dev_keys), 
+        "dev_present_only": sorted(dev_keys - prod_keys), 
         "global_att": [] 
     }
 
-    for k in dev_ds.__dict__.keys():
-        if k not in prod_ds.__dict__.keys(): att["dev_present_only"].append(k)
-
-    for k in prod_ds.__dict__.keys():
-        if k not in dev_ds.__dict__.keys(): att["prod_present_only"].append(k)
-
-    # Compare global attributes
-    prod_dict = dict(prod_ds.__dict__.items())
-    for k,v in dev_ds.__dict__.items():
-        # Check if variable is present in production
-        if not k in prod_ds.__dict__.keys():
-            continue
-
-        # Check if equal
-        if prod_dict[k] != v: att["global_att"].append((k, prod_dict[k], v))
+    # Compare global attributes present in both
+    for k in sorted(dev_keys & prod_keys):
+        if not _values_equal(dev_dict[k], prod_dict[k]): 
+            att["global_att"].append((k, prod_dict[k], dev_dict[k]))
     
     return att
 
 def compare_dimensions(dev_ds, prod_ds):
     """Compare NetCDF dimensions between NetCDF Dataset objects. """
 
+    dev_dims = dev_ds.dimensions
+    prod_dims = prod_ds.dimensions
+    dev_keys = dev_dims.keys()
+    prod_keys = prod_dims.keys()
+
     dim = {
-        "prod_present_only": [],
-        "dev_present_only": [],
+        "prod_present_only": sorted(prod_keys - dev_keys),
+        "dev_present_only": sorted(dev_keys - prod_keys),
         "names_not_equal": [],
         "size_not_equal": []
     }
 
-    for k in dev_ds.dimensions.keys():
-        if k not in prod_ds.dimensions.keys(): dim["dev_present_only"].append(k)
-
-    for k in prod_ds.dimensions.keys():
-        if k not in dev_ds.dimensions.keys(): dim["prod_present_only"].append(k)
-
-    for k,v in dev_ds.dimensions.items():
-        # Check if variable is present in production
-        if not k in prod_ds.dimensions.keys():
-            continue
-
-        # Check if names are equal
-        if prod_ds.dimensions[k].name != v.name: dim["names_not_equal"].append((k, prod_ds.dimensions[k].name, v.name))
-        
-        # Check if sizes are equal
-        if prod_ds.dimensions[k].size != v.size: dim["size_not_equal"].append((k, prod_ds.dimensions[k].size, v.size))
+    # Compare dimensions present in both
+    shared = sorted(dev_keys & prod_keys)
+    count = len(shared)
+    
+    # Check if names are equal
+    dev_names = np.array([dev_dims[k].name for k in shared], dtype=object)
+    prod_names = np.array([prod_dims[k].name for k in shared], dtype=object)
+    dim["names_not_equal"] = [ (shared[i], prod_names[i], dev_names[i]) 
+                              for i in np.flatnonzero(dev_names != prod_names) ]
+    
+    # Check if sizes are equal
+    dev_sizes = np.fromiter((dev_dims[k].size for k in shared), dtype=np.int64, count=count)
+    prod_sizes = np.fromiter((prod_dims[k].size for k in shared), dtype=np.int64, count=count)
+    dim["size_not_equal"] = [ (shared[i], int(prod_sizes[i]), int(dev_sizes[i])) 
+                             for i in np.flatnonzero(dev_sizes != prod_sizes) ]
     
     return dim
 
-def compare_variables(dev_ds, prod_ds):
+def compare_variables(dev_ds, prod_ds, h5_files=None):
     """Compare NetCDF variables between NetCDF Dataset objects. """
 
+    dev_vars = dev_ds.variables
+    prod_vars = prod_ds.variables
+    dev_keys = dev_vars.keys()
+    prod_keys = prod_vars.keys()
+    
+    # Read raw values; _FillValue and scale attributes are compared separately
+    with _NC_LOCK:
+        dev_ds.set_auto_maskandscale(False)
+        prod_ds.set_auto_maskandscale(False)
+
     var = {
-        "prod_present_only": [],
-        "dev_present_only": [],
+        "prod_present_only": sorted(prod_keys - dev_keys),
+        "dev_present_only": sorted(dev_keys - prod_keys),
         "var_content": {}
     }
 
-    for k in dev_ds.variables.keys():
-        if k not in prod_ds.variables.keys(): var["dev_present_only"].append(k)
-
-    for k in prod_ds.variables.keys():
-        if k not in dev_ds.variables.keys(): var["prod_present_only"].append(k)
-
-    # Compare variables
-    for k,v in dev_ds.variables.items():
+    # Compare variables present in both
+    shared = sorted(dev_keys & prod_keys)
+    dev_shared = [dev_vars[k] for k in shared]
+    prod_shared = [prod_vars[k] for k in shared]
+    compare_one = partial(_compare_one_var, h5_files=h5_files)
+    if len(shared) < MIN_VAR_THREADS:
+        results = map(compare_one, shared, dev_shared, prod_shared)
+    else:
+        with ThreadPoolExecutor(max_workers=VAR_WORKERS) as executor:
+            results = list(executor.map(compare_one, shared, dev_shared, prod_shared))
+    var["var_content"] = dict(zip(shared, results))
 
-        var["var_content"][k] = {}
-        
-        # Check if variable is present in production
-        if not k in prod_ds.variables.keys():
-            continue
+    return var
 
-        # Compare variable attributes
-        dev_atts = v.__dict__.keys()
-        prod_atts = prod_ds[k].__dict__.keys()
-        var["var_content"][k]["atts_equal"] = reduce(lambda j, k: j and k, map(lambda i, j: i == j, dev_atts, prod_atts), True)
+def _compare_one_var(name, dev_var, prod_var, h5_files=None):
+    """Compare attributes and data of a single NetCDF variable.
+    
+    name is the variable's key in both datasets which is used to look up the
+    variable with h5py without querying the netCDF-C library for it.
+    """
+    
+    # Read variable attributes and layout
+    with _NC_LOCK:
+        dev_atts = dev_var.__dict__
+        prod_atts = prod_var.__dict__
+        shape = dev_var.shape
+        same_layout = shape == prod_var.shape and dev_var.dtype == prod_var.dtype
+    
+    # Compare variable attributes
+    atts_equal = dev_atts.keys() == prod_atts.keys() \
+        and all(_values_equal(dev_atts[a], prod_atts[a]) for a in dev_atts)
+    
+    # Compare variable arrays only if shapes and types match; identical raw 
+    # chunks avoid decompressing the data
+    if not same_layout:
+        arrays_equal = False
+    elif h5_files and _raw_chunks_equal(*h5_files, name):
+        arrays_equal = True
+    else:
+        arrays_equal = _streaming_equal(dev_var, prod_var, shape)
+    
+    return {
+        "atts_equal": atts_equal,
+        "arrays_equal": arrays_equal
+    }
 
-        # Compare variable arrays
-        dev_v = v[:].filled(-9999)
-        prod_v = prod_ds[k][:].filled(-9999)
-        var["var_content"][k]["arrays_equal"] = np.array_equal(dev_v, prod_v, equal_nan=True)
+def _values_equal(dev_value, prod_value):
+    """Return boolean value indicating if two attribute values are equal.
+    
+    Floating point values are compared so that NaN equals NaN, e.g. a NaN 
+    _FillValue.
+    """
+    
+    if dev_value is prod_value:
+        return True
+    if isinstance(dev_value, str) or isinstance(prod_value, str):
+        return bool(dev_value == prod_value)
+    dev_array, prod_array = np.asarray(dev_value), np.asarray(prod_value)
+    kinds = {dev_array.dtype.kind, prod_array.dtype.kind}
+    if kinds & set("fc") and kinds <= set("biufc"):
+        return np.array_equal(dev_array, prod_array, equal_nan=True)
+    if isinstance(dev_value, np.ndarray) or isinstance(prod_value, np.ndarray):
+        return np.array_equal(dev_array, prod_array)
+    return bool(dev_value == prod_value)
+
+def _raw_chunks_equal(dev_h5, prod_h5, name):
+    """Compare the stored chunks of a variable without decompressing them.
+    
+    Returns True if the variable has the same chunk layout, filters, fill 
+    value and raw chunk bytes in both files. False means the decompressed 
+    data still needs to be compared. Chunks of variable-length types hold 
+    heap references instead of the data so those are never compared raw.
+    """
+    
+    with _NC_LOCK:
+        dev_dset = dev_h5.get(name)
+        prod_dset = prod_h5.get(name)
+        if not isinstance(dev_dset, h5py.Dataset) or not isinstance(prod_dset, h5py.Dataset):
+            return False
+        if not (_fixed_size(dev_dset.dtype) and _fixed_size(prod_dset.dtype)):
+            return False
+        if dev_dset.chunks is None or dev_dset.chunks != prod_dset.chunks:
+            return False
+        if not _values_equal(dev_dset.fillvalue, prod_dset.fillvalue) \
+            or _filters(dev_dset) != _filters(prod_dset):
+            return False
+        dev_id, prod_id = dev_dset.id, prod_dset.id
+        num_chunks = dev_id.get_num_chunks()
+        if num_chunks != prod_id.get_num_chunks():
+            return False
+    
+    for i in range(num_chunks):
+        with _NC_LOCK:
+            offset = dev_id.get_chunk_info(i).chunk_offset
+            try:
+                dev_chunk = dev_id.read_direct_chunk(offset)
+                prod_chunk = prod_id.read_direct_chunk(offset)
+            except (KeyError, OSError, ValueError):
+                # Chunk not allocated in prod
+                return False
+        if dev_chunk != prod_chunk:
+            return False
+    return True
+
+def _fixed_size(dtype):
+    """Return True if dtype has no variable-length strings or sequences."""
+    
+    if dtype.fields:
+        return all(_fixed_size(field[0]) for field in dtype.fields.values())
+    if dtype.subdtype:
+        return _fixed_size(dtype.subdtype[0])
+    string_info = h5py.check_string_dtype(dtype)
+    if string_info is not None:
+        return string_info.length is not None
+    return dtype.kind != "O" and h5py.check_vlen_dtype(dtype) is None
+
+def _filters(dset):
+    """Return the HDF5 filter pipeline of an h5py Dataset."""
+    
+    plist = dset.id.get_create_plist()
+    return [ plist.get_filter(i) for i in range(plist.get_nfilters()) ]
 
-    return var
+def _streaming_equal(dev_var, prod_var, shape):
+    """Compare NetCDF variables of the same shape one chunk at a time.
+    
+    Variables are read along their first non-singleton dimension in steps
+    of the on-disk chunk size and the comparison stops at the first chunk
+    that is not equal.
+    
+    Returns boolean value indicating if variables are equal
+    """
+    
+    # Scalar variables
+    if len(shape) == 0:
+        with _NC_LOCK:
+            dev_v = dev_var[:]
+            prod_v = prod_var[:]
+        return _fast_eq(dev_v, prod_v)
+    
+    axis = next((i for i, size in enumerate(shape) if size > 1), 0)
+    row_bytes = np.dtype(dev_var.dtype).itemsize * int(np.prod(shape[axis + 1:]))
+    with _NC_LOCK:
+        chunking = dev_var.chunking()
+        if chunking == "contiguous":
+            step = max(1, STREAM_BYTES // max(1, row_bytes))
+        else:
+            # Size chunk caches to hold one row of chunks so each chunk is 
+            # only read and decompressed once
+            step = chunking[axis]
+            cache_bytes = min(CHUNK_CACHE_BYTES, max(1 << 20, step * row_bytes))
+            for nc_var in (dev_var, prod_var):
+                nc_var.set_var_chunk_cache(size=cache_bytes, 
+                                           nelems=CHUNK_CACHE_SLOTS, 
+                                           preemption=0.75)
+    
+    index = [slice(None)] * len(shape)
+    for start in range(0, shape[axis], step):
+        index[axis] = slice(start, start + step)
+        with _NC_LOCK:
+            dev_v = dev_var[tuple(index)]
+            prod_v = prod_var[tuple(index)]
+        if not _fast_eq(dev_v, prod_v):
+            return False
+    return True
+
+def _fast_eq(dev_v, prod_v):
+    """Return boolean value indicating if two variable arrays are equal.
+    
+    The NaN-aware comparison is only run for floating point data that is not 
+    exactly equal. Object arrays of strings or ragged VLType sequences are 
+    compared element by element.
+    """
+    
+    if dev_v.shape != prod_v.shape or dev_v.dtype != prod_v.dtype:
+        return False
+    
+    if dev_v.dtype.kind == "O":
+        return all(_values_equal(dev_e, prod_e) for dev_e, prod_e in zip(dev_v.flat, prod_v.flat))
+    
+    if np.array_equal(dev_v, prod_v):
+        return True
+    return dev_v.dtype.kind == "f" and np.array_equal(dev_v, prod_v, equal_nan=True)
 
 def write_netcdf_report(data_dict, report_file, dataset):
-    """Writes NetCDF file differences to disk."""
+    """Writes NetCDF file differences to disk.
+    
+    Each NetCDF file's report is assembled in memory and written to the report
+    file with a single write.
+    """
 
-    granule_data = { "granules": {} }
-    with open(report_file, 'a') as rf:
+    granule_data = {}
+    granules = {}
+    with open(report_file, 'a', buffering=REPORT_BUFFER) as rf:
         rf.write(f"\n=================== NetCDF Reports for {dataset} =======================\n")
         nc_not_equal = []
-        for nc_file in data_dict.keys():
-            rf.write(f"\n\n<< Report for file: {nc_file} >>\n")    
-            equal_dims = write_netcdf_dims(data_dict[nc_file]["dim_dict"], rf)
-            equal_atts, ops_date, test_date = write_netcdf_atts(data_dict[nc_file]["att_dict"], rf)
-            equal_vars = write_netcdf_var(data_dict[nc_file]["var_dict"], rf)
+        for nc_file, file_dict in data_dict.items():
+            parts = [f"\n\n<< Report for file: {nc_file} >>\n"]
+            equal_dims = write_netcdf_dims(file_dict["dim_dict"], parts)
+            equal_atts, ops_date, test_date = write_netcdf_atts(file_dict["att_dict"], parts)
+            equal_vars = write_netcdf_var(file_dict["var_dict"], parts)
             if not equal_dims or not equal_atts or not equal_vars: nc_not_equal.append(nc_file)
-            granule_data["granules"][nc_file] = {
+            granules[nc_file] = {
                 "equal_dims": equal_dims,
                 "equal_atts": equal_atts,
                 "equal_vars": equal_vars,
                 "ops_date": ops_date,
                 "uat_date": test_date
             }
-            rf.write("--------------------------------------------------------------------------------------\n")
+            parts.append("--------------------------------------------------------------------------------------\n")
+            rf.write("".join(parts))
+        granule_data["granules"] = granules
 
         if len(nc_not_equal) != 0:
             granule_data["nc_not_equal"] = nc_not_equal
-            rf.write("\n<<<< NetCDF files that are different: >>>>\n")
-            for nc_file in nc_not_equal:
-                rf.write(f"\t{nc_file}\n")
+            rf.write("\n<<<< NetCDF files that are different: >>>>\n" 
+                     + "".join(f"\t{nc_file}\n" for nc_file in nc_not_equal))
         else:
             rf.write("\n<<<< All NetCDF files that were compared are equal. >>>>\n")
         
@@ -210,155 +526,155 @@ def write_netcdf_report(data_dict, report_file, dataset):
             granule_data["report_file"] = report_file.name    
         return granule_data
 
-def write_netcdf_atts(att_dict, rf):
+def write_netcdf_atts(att_dict, parts):
     """Write global attribute differences to the report.
     
     Attributes
     ----------
     att_dict: dict
         Dictionary of global attribute-level differences
-    rf: _io.TextIOWrapper
-        Report file handle to write to
+    parts: list
+        List of report strings to append to
 
     Returns boolean value indicating if datasets are equal
     """
         
-    rf.write("\n<<<< Global Attribute-Level Differences >>>>\n")
+    parts.append("\n<<<< Global Attribute-Level Differences >>>>\n")
     equal = True
     prod_date = ""
     test_date = ""
         
     if len(att_dict["dev_present_only"]) != 0:
         equal = False
-        rf.write("\t\tAttributes in development only:\n")
+        parts.append("\t\tAttributes in development only:\n")
         for e in att_dict["dev_present_only"]:
-            rf.write(f"\t\t{e}\n")
+            parts.append(f"\t\t{e}\n")
     else:
-        rf.write("\t\tAttributes in development are accounted for.\n")
+        parts.append("\t\tAttributes in development are accounted for.\n")
 
     if len(att_dict["prod_present_only"]) != 0:
         equal = False
-        rf.write("\t\tAttributes in production only:\n")
+        parts.append("\t\tAttributes in production only:\n")
         for e in att_dict["prod_present_only"]:
-            rf.write(f"\t\t{e}\n")
+            parts.append(f"\t\t{e}\n")
     else:
-        rf.write("\t\tAttributes in production are accounted for.\n")
+        parts.append("\t\tAttributes in production are accounted for.\n")
 
     if len(att_dict["global_att"]) != 0:
         equal = False
-        rf.write("\t\tAttribute names that are not equal:\n")
+        parts.append("\t\tAttribute names that are not equal:\n")
         for e in att_dict["global_att"]:
-            rf.write(f"\t\tName: {e[0]}\n")
-            rf.write(f"\t\t\tProduction: {e[1]}\n")
-            rf.write(f"\t\t\tDevelopment: {e[2]}\n")
+            parts.append(f"\t\tName: {e[0]}\n")
+            parts.append(f"\t\t\tProduction: {e[1]}\n")
+            parts.append(f"\t\t\tDevelopment: {e[2]}\n")
             if e[0] == "date_created": 
                 prod_date = e[1]
                 test_date = e[2]
                 if len(att_dict["global_att"]) == 1: equal = True
     else:
-        rf.write("\t\tAttributes are the same.\n")
+        parts.append("\t\tAttributes are the same.\n")
     
     return equal, prod_date, test_date
 
-def write_netcdf_dims(dim_dict, rf):
+def write_netcdf_dims(dim_dict, parts):
     """Write dimension differences to the report.
     
     Attributes
     ----------
     dim_dict: dict
         Dictionary of dimension-level differences
-    rf: _io.TextIOWrapper
-        Report file handle to write to
+    parts: list
+        List of report strings to append to
 
     Returns boolean value indicating if datasets are equal
     """
 
-    rf.write("\n<<<< Dimension-Level Differences >>>>\n")
+    parts.append("\n<<<< Dimension-Level Differences >>>>\n")
     equal = True
 
     if len(dim_dict["dev_present_only"]) != 0:
         equal = False
-        rf.write("\t\tDimensions in development only:\n")
+        parts.append("\t\tDimensions in development only:\n")
         for e in dim_dict["dev_present_only"]:
-            rf.write(f"\t\t{e}\n")
+            parts.append(f"\t\t{e}\n")
     else:
-        rf.write("\t\tDimensions in development are accounted for.\n")
+        parts.append("\t\tDimensions in development are accounted for.\n")
 
     if len(dim_dict["prod_present_only"]) != 0:
         equal = False
-        rf.write("\t\tDimensions in production only:\n")
+        parts.append("\t\tDimensions in production only:\n")
         for e in dim_dict["prod_present_only"]:
-            rf.write(f"\t\t{e}\n")
+            parts.append(f"\t\t{e}\n")
     else:
-        rf.write("\t\tDimensions in production are accounted for.\n")
+        parts.append("\t\tDimensions in production are accounted for.\n")
 
     if len(dim_dict["names_not_equal"]) != 0:
         equal = False
-        rf.write("\t\tDimension names that are not equal:\n")
+        parts.append("\t\tDimension names that are not equal:\n")
         for e in dim_dict["names_not_equal"]:
-            rf.write(f"\t\tName: {e[0]}\n")
-            rf.write(f"\t\t\tProduction: {e[1]}\n")
-            rf.write(f"\t\t\tDevelopment: {e[2]}\n")
+            parts.append(f"\t\tName: {e[0]}\n")
+            parts.append(f"\t\t\tProduction: {e[1]}\n")
+            parts.append(f"\t\t\tDevelopment: {e[2]}\n")
     else:
-        rf.write("\t\tDimension names are the same.\n")
+        parts.append("\t\tDimension names are the same.\n")
 
     if len(dim_dict["size_not_equal"]) != 0:
         equal = False
-        rf.write("\t\tDimension sizes that are not equal:\n")
+        parts.append("\t\tDimension sizes that are not equal:\n")
         for e in dim_dict["size_not_equal"]:
-            rf.write(f"\t\tSize: {e[0]}\n")
-            rf.write(f"\t\t\tProduction: {e[1]}\n")
-            rf.write(f"\t\t\tDevelopment: {e[2]}\n")
+            parts.append(f"\t\tSize: {e[0]}\n")
+            parts.append(f"\t\t\tProduction: {e[1]}\n")
+            parts.append(f"\t\t\tDevelopment: {e[2]}\n")
     else:
-        rf.write("\t\tDimension sizes are the same.\n")
+        parts.append("\t\tDimension sizes are the same.\n")
 
     return equal
 
-def write_netcdf_var(var_dict, rf):
+def write_netcdf_var(var_dict, parts):
     """Write variable differences to report.
     
     Attributes
     ----------
     var_dict: dict
         Dictionary of variable-level differences
-    rf: _io.TextIOWrapper
-        Report file handle to write to
+    parts: list
+        List of report strings to append to
 
     Returns boolean value indicating if datasets are equal
     """
 
-    rf.write("\n<<<< Variable-Level Differences >>>>\n")
+    parts.append("\n<<<< Variable-Level Differences >>>>\n")
     equal = True
 
     if len(var_dict["dev_present_only"]) != 0:
         equal = False
-        rf.write("\t\tVariables in development only:\n")
+        parts.append("\t\tVariables in development only:\n")
         for e in var_dict["dev_present_only"]:
-            rf.write(f"\t\t\t{e}\n")
+            parts.append(f"\t\t\t{e}\n")
     else:
-        rf.write("\t\tVariables in development are accounted for.\n")
+        parts.append("\t\tVariables in development are accounted for.\n")
 
     if len(var_dict["prod_present_only"]) != 0:
         equal = False
-        rf.write("\t\tVariables in production only:\n")
+        parts.append("\t\tVariables in production only:\n")
         for e in var_dict["prod_present_only"]:
-            rf.write(f"\t\t\t{e}\n")
+            parts.append(f"\t\t\t{e}\n")
     else:
-        rf.write("\t\tVariables in production are accounted for.\n")
+        parts.append("\t\tVariables in production are accounted for.\n")
 
-    rf.write("\t\tVariable attributes and data that are not equal:\n")
+    parts.append("\t\tVariable attributes and data that are not equal:\n")
     for k in var_dict["var_content"].keys():
         try:
             atts_equal = var_dict["var_content"][k]["atts_equal"]
             data_equal = var_dict["var_content"][k]["arrays_equal"]
             if not atts_equal or not data_equal: 
                 equal = False
-                rf.write(f"\t\t\t{k}:\n")
-                rf.write(f"\t\t\t\tAttributes equal: {atts_equal}\n")
-                rf.write(f"\t\t\t\tData equal: {data_equal}\n")
+                parts.append(f"\t\t\t{k}:\n")
+                parts.append(f"\t\t\t\tAttributes equal: {atts_equal}\n")
+                parts.append(f"\t\t\t\tData equal: {data_equal}\n")
         except KeyError:
             equal = False
             continue
 
-    if equal == True: rf.write(f"\t\t\tAll variables have been accounted for.\n")
+    if equal == True: parts.append(f"\t\t\tAll variables have been accounted for.\n")
     return equal
@@ -22,25 +22,74 @@ NOTE: Direct S3 access is untested while awaiting deployment.
 # Standard imports
 import argparse
 import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
-import json
+from functools import partial
+import hashlib
 import logging
+from operator import itemgetter
+import os
 import pathlib
 import sys
+import threading
+import time
+from urllib.parse import urlsplit
 
 # Third-party imports
-import boto3
-import botocore
+import ijson
+import orjson
 import requests
-from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Local imports
-from netcdf import compare_netcdfs_s3, compare_netcdfs_dl
-from write import write_txt_report, write_html_reports
+# boto3, botocore and the local netcdf and write modules are imported where 
+# they are used so runs that exit early do not pay for loading them
 
 # Constants
 S3_OPS = "https://archive.podaac.earthdata.nasa.gov/s3credentials"
 S3_TEST = "https://archive.podaac.uat.earthdata.nasa.gov/s3credentials"
+DOWNLOAD_WORKERS = 16
+POOL_SIZE = 32
+POOL_MAXSIZE = 64
+RETRY_STATUSES = [500, 502, 503, 504]
+CMR_PAGE_SIZE = 2000
+URL_TYPES = {
+    True: "GET DATA",
+    False: "GET DATA VIA DIRECT ACCESS"
+}
+CHUNK_SIZE = 1 << 20
+RANGE_THRESHOLD = 16 << 20
+RANGE_SIZE = 8 << 20
+RANGE_WORKERS = 4
+DELETE_WORKERS = 32
+STREAM_JSON_BYTES = 4 << 20
+S3_CONCURRENCY = 16
+S3_CREDS_MARGIN = datetime.timedelta(minutes=5)
+TOKEN_MARGIN = datetime.timedelta(seconds=60)
+CREDS_CACHE_FILE = pathlib.Path(os.path.expanduser("~/.cache/podaac_generate_compare/tokens.json"))
+CMR_CACHE_DIR = CREDS_CACHE_FILE.parent.joinpath("cmr")
+CMR_CACHE_TTL = datetime.timedelta(minutes=10)
+EDL_PARAMETERS = ["generate-edl-username", "generate-edl-password"]
+
+# HTTP session shared by all requests so connections are reused; CMR searches
+# are POSTs but read only so they are retried as well
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, 
+                                      pool_maxsize=POOL_MAXSIZE,
+                                      max_retries=Retry(total=3, 
+                                                        backoff_factor=0.3,
+                                                        status_forcelist=RETRY_STATUSES,
+                                                        allowed_methods=["HEAD", "GET", "POST"],
+                                                        raise_on_status=False)))
+
+# Credentials cached for the life of the process
+_EDL_CREDS = {}
+_TOKENS = {}
+_S3_CREDS = {}
+_S3_CLIENTS = {}
+_CLIENTS = {}
+_CACHE_LOCK = threading.Lock()
+_EDL_LOCK = threading.Lock()
     
 class Compare:
     """Class that compares test environment L2P granules with ops environment 
@@ -69,276 +118,694 @@ class Compare:
         self.logger = logger
         self.downloads = []
         self.test_granules = []
-        self.edl_creds = get_edl_creds(logger)
-        self.test_token = get_token(self.edl_creds, self.TEST_TOKEN, logger)
+        self.test_names = {}
         self.ops_granules = []
-        self.ops_token = get_token(self.edl_creds, self.OPS_TOKEN, logger)
+        self.ops_names = {}
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            test_future = executor.submit(get_token, self.TEST_TOKEN, logger)
+            ops_future = executor.submit(get_token, self.OPS_TOKEN, logger)
+            self.test_token = test_future.result()
+            self.ops_token = ops_future.result()
         self.granule_diffs = {
             "ops_only": [],
             "test_only": []
         }
         self.netcdf = {}
             
-    def compare_granules(self, to_download, download_dir):
-        """Compare test and ops granules to produce a report on differences."""
+    def compare_granules(self, to_download, download_dir, s3_download=False, 
+                         max_concurrency=DOWNLOAD_WORKERS):
+        """Compare test and ops granules to produce a report on differences.
         
-        # Test only
-        if to_download:
-            ops_prefix = f"https://{'/'.join(self.ops_granules[0].split('/')[2:-1])}"
-        else:
-            ops_prefix = f"s3://{'/'.join(self.ops_granules[0].split('/')[2:-1])}"
-        self.granule_diffs["test_only"] = [ test for test in self.test_granules if f"{ops_prefix}/{test.split('/')[-1]}" not in self.ops_granules ]
+        Granules are downloaded directly from S3 when s3_download is set and 
+        max_concurrency limits the number of concurrent downloads.
+        """
         
-        # Ops only
-        if to_download:
-            test_prefix = f"https://{'/'.join(self.test_granules[0].split('/')[2:-1])}"
-        else:
-            test_prefix = f"s3://{'/'.join(self.test_granules[0].split('/')[2:-1])}"
-        self.granule_diffs["ops_only"] = [ ops for ops in self.ops_granules if f"{test_prefix}/{ops.split('/')[-1]}" not in self.test_granules ]
+        # Nothing to compare if either environment has no granules
+        if not self.ops_granules or not self.test_granules:
+            self.granule_diffs["test_only"] = list(self.test_granules)
+            self.granule_diffs["ops_only"] = list(self.ops_granules)
+            self.logger.info("Granules missing from ops or test. No granules to compare.")
+            return
+        
+        ops_names = self.ops_names
+        test_names = self.test_names
+        
+        # Test only and ops only
+        self.granule_diffs["test_only"] = [ test for name, test in test_names.items() if name not in ops_names ]
+        self.granule_diffs["ops_only"] = [ ops for name, ops in ops_names.items() if name not in test_names ]
         
         # Intersection
-        ops = set([ops.split('/')[-1] for ops in self.ops_granules])
-        test = set([test.split('/')[-1] for test in self.test_granules])
-        granule_intersection = list(ops.intersection(test))
+        granule_intersection = [ name for name in ops_names if name in test_names ]
         self.logger.info(f"Number of OPS granules: {len(self.ops_granules)}.")
         self.logger.info(f"Number of UAT granules: {len(self.test_granules)}.")
         self.logger.info(f"OPS and UAT intersection: {len(granule_intersection)} granules.")
         
-        # Run comparison
+        if not granule_intersection:
+            self.logger.info("No granules to compare.")
+            return
+        
+        import botocore
+        from netcdf import compare_netcdfs_s3, compare_netcdfs_dl
+        
+        # Run comparison on granules under each environment's prefix
+        scheme = "https" if to_download and not s3_download else "s3"
+        ops_prefix = granule_prefix(self.ops_granules[0], scheme)
+        test_prefix = granule_prefix(self.test_granules[0], scheme)
         if to_download:
             self.logger.info(f"Downloading {len(granule_intersection)} ops granules and {len(granule_intersection)} test granules.")
-            self.downloads = download_files(granule_intersection, download_dir, ops_prefix, test_prefix, self.ops_token, self.test_token, self.logger)
+            if s3_download:
+                s3_creds = get_s3_creds(self.logger)
+                self.downloads = download_files_s3(granule_intersection, download_dir, ops_prefix, test_prefix, s3_creds, self.logger, max_concurrency)
+            else:
+                self.downloads = download_files(granule_intersection, download_dir, ops_prefix, test_prefix, self.ops_token, self.test_token, self.logger, max_concurrency)
             self.netcdf = compare_netcdfs_dl(granule_intersection, download_dir, self.logger)
         else:
             try:
-                s3_creds = get_s3_creds(self.edl_creds, self.logger)
+                s3_creds = get_s3_creds(self.logger)
                 self.netcdf = compare_netcdfs_s3(granule_intersection, ops_prefix, test_prefix, s3_creds, self.logger)
             except botocore.exceptions.ClientError as e:
                 raise e
     
-    def query_date(self, shortname, start, end, to_download, search_revision, logger):
+    def query_date(self, shortname, start, end, to_download, search_revision, logger, use_cache=True):
         """Query by temporal range and populate test and ops granules lists."""
         
         temporal_range = f"{start}Z,{end}Z"
-        self.test_granules = run_query_date(shortname, temporal_range, self.test_token, self.TEST_CMR, to_download, search_revision, logger)
-        self.ops_granules = run_query_date(shortname, temporal_range, self.ops_token, self.OPS_CMR, to_download, search_revision, logger)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            test_future = executor.submit(run_query_date, shortname, temporal_range, self.test_token, self.TEST_CMR, to_download, search_revision, logger, use_cache)
+            ops_future = executor.submit(run_query_date, shortname, temporal_range, self.ops_token, self.OPS_CMR, to_download, search_revision, logger, use_cache)
+            self.test_granules = test_future.result()
+            self.ops_granules = ops_future.result()
+        self.test_names = index_granules(self.test_granules)
+        self.ops_names = index_granules(self.ops_granules)
 
-    def query_name(self, shortname, granule_name, to_download):
+    def query_name(self, shortname, granule_name, to_download, use_cache=True):
         """Query by granule name and populate test and ops granules lists."""
         
         # Search for and store granules for different environments
-        self.test_granules.extend(run_query_name(shortname, granule_name, self.test_token, self.TEST_CMR, to_download))
-        self.ops_granules.extend(run_query_name(shortname, granule_name, self.ops_token, self.OPS_CMR, to_download))
-    
-    def write_reports(self, report_dir, html_dir, shortname, start_time, create_html, netcdf=False):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            test_future = executor.submit(run_query_name, shortname, granule_name, self.test_token, self.TEST_CMR, to_download, self.logger, use_cache)
+            ops_future = executor.submit(run_query_name, shortname, granule_name, self.ops_token, self.OPS_CMR, to_download, self.logger, use_cache)
+            test_granules = test_future.result()
+            ops_granules = ops_future.result()
+        self.test_granules.extend(test_granules)
+        self.ops_granules.extend(ops_granules)
+        self.test_names.update(index_granules(test_granules))
+        self.ops_names.update(index_granules(ops_granules))
+    
+    def write_reports(self, report_dir, html_dir, shortname, start_time, create_html, netcdf=False,
+                      date_str=None):
+        
+        from write import write_txt_report, write_html_reports
         
         granule_data = write_txt_report(report_dir, shortname, start_time,
                                         self.ops_granules, self.test_granules, 
                                         self.granule_diffs, self.netcdf, 
-                                        self.logger, netcdf)
+                                        self.logger, netcdf, date_str)
         
         if create_html:
             write_html_reports(html_dir, shortname, report_dir, start_time, 
                                self.ops_granules, self.test_granules, 
-                               self.granule_diffs, granule_data, self.logger)
+                               self.granule_diffs, granule_data, self.logger,
+                               date_str)
     
     def delete_downloads(self):
         """Delete downloaded files."""
         
-        for download in self.downloads:
-            download.unlink()
-            self.logger.info(f"Deleted: {download}")
+        with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as executor:
+            list(executor.map(partial(pathlib.Path.unlink, missing_ok=True), self.downloads))
+        self.logger.info(f"Deleted {len(self.downloads)} downloaded files.")
             
         
+def index_granules(granules):
+    """Return dictionary of granule file name to granule URL."""
+    
+    return { granule.rsplit('/', 1)[-1]: granule for granule in granules }
+
+def granule_prefix(granule, scheme):
+    """Return the directory of a granule URL under scheme."""
+    
+    return f"{scheme}://{granule.partition('://')[2].rsplit('/', 1)[0]}"
+
 def get_edl_creds(logger):
-    """Return Earthdata Login creds stored in SSM Parameter Store."""
+    """Return Earthdata Login creds stored in SSM Parameter Store.
+    
+    Only called when a token or S3 credentials are not cached so runs with 
+    cached credentials do not load boto3.
+    """
+    
+    with _EDL_LOCK:
+        if not _EDL_CREDS:
+            fetch_edl_creds(logger)
+    return _EDL_CREDS
+
+def fetch_edl_creds(logger):
+    """Retrieve Earthdata Login creds from SSM Parameter Store into 
+    _EDL_CREDS."""
+    
+    import botocore
     
     # Get EDL credentials
     try:
-        ssm_client = boto3.client('ssm', region_name="us-west-2")
-        username = ssm_client.get_parameter(Name="generate-edl-username", WithDecryption=True)["Parameter"]["Value"]
-        password = ssm_client.get_parameter(Name="generate-edl-password", WithDecryption=True)["Parameter"]["Value"]
+        response = get_ssm_client().get_parameters(Names=EDL_PARAMETERS, WithDecryption=True)
+        parameters = { parameter["Name"]: parameter["Value"] for parameter in response["Parameters"] }
+        username, password = [ parameters[name] for name in EDL_PARAMETERS ]
         logger.info(f"Retrieved EDL username: {username} and password.")
-    except botocore.exceptions.ClientError as error:
+    except (botocore.exceptions.ClientError, KeyError) as error:
         logger.error("Could not retrieve EDL credentials from SSM Parameter Store.")
         logger.error(error)
         raise error
     
-    return {
-        "username": username,
-        "password": password
-    }
+    # Encode basic auth once for token and S3 credential requests
+    encoded_auth = base64.b64encode(f"{username}:{password}".encode()).decode("ascii")
+    _EDL_CREDS.update(username=username, password=password, 
+                      authorization=f"Basic {encoded_auth}")
+        
+def get_ssm_client():
+    """Return SSM client, created once and reused for the life of the process."""
+    
+    if "ssm" not in _CLIENTS:
+        import boto3
+        _CLIENTS["ssm"] = boto3.client('ssm', region_name="us-west-2")
+    return _CLIENTS["ssm"]
         
-def get_token(edl_creds, url, logger):
+def get_token(url, logger):
     """Return EDL bearer token based on url parameter.
     
-    Accesses EDL username and password stored in SSM Parameter Store.
+    Tokens are reused from memory or the credentials cache file until they 
+    expire.
     
     Raises botocore.exceptions.ClientError
     """
     
-    # Get EDL bearer token
-    post_response = requests.get(url, 
-                                 headers={"Accept": "application/json"}, 
-                                 auth=HTTPBasicAuth(edl_creds["username"], edl_creds["password"]))
-    token_data = post_response.json()
-    if len(token_data) == 0:
-        logger.error(token_data)
-        logger.error(f"Could not retrieve token from: {url}.")
-        return None
+    if url in _TOKENS:
+        return _TOKENS[url]
+    
+    entry = read_cache(url, TOKEN_MARGIN)
+    if entry:
+        token = entry["value"]
+        logger.info(f"Using cached token for {url}.")
     else:
+        # Get EDL bearer token
+        post_response = SESSION.get(url, 
+                                    headers={
+                                        "Accept": "application/json",
+                                        "Authorization": get_edl_creds(logger)["authorization"]
+                                    })
+        token_data = post_response.json()
+        if len(token_data) == 0:
+            logger.error(token_data)
+            logger.error(f"Could not retrieve token from: {url}.")
+            return None
         logger.info(f"Successfully retrieved token from {url}.")
-        return token_data[0]["access_token"]
+        token = token_data[0]["access_token"]
+        expiration = token_expiration(token, token_data[0])
+        if expiration:
+            write_cache(url, token, expiration)
+    
+    _TOKENS[url] = token
+    return token
+
+def token_expiration(token, token_data):
+    """Return token expiration as a POSIX timestamp from the JWT exp claim or 
+    the EDL expiration date."""
     
-def run_query_date(shortname, temporal_range, token, url, to_download, search_revision, logger):
+    try:
+        payload = token.split(".")[1]
+        claims = orjson.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        pass
+    try:
+        return datetime.datetime.strptime(token_data["expiration_date"], "%m/%d/%Y").timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def load_cache():
+    """Return credentials cache dictionary or an empty dictionary if the cache 
+    file is missing or unreadable."""
+    
+    try:
+        with open(CREDS_CACHE_FILE, "rb") as cf:
+            cache = orjson.loads(cf.read())
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def read_cache(key, margin):
+    """Return cache entry with value and exp for key or None if missing or 
+    expiring within margin."""
+    
+    entry = load_cache().get(key)
+    if not isinstance(entry, dict) or "value" not in entry:
+        return None
+    if entry.get("exp", 0) - margin.total_seconds() <= time.time():
+        return None
+    return entry
+
+def write_cache(key, value, expiration):
+    """Store value with its expiration in the credentials cache file readable 
+    only by the user."""
+    
+    with _CACHE_LOCK:
+        cache = load_cache()
+        cache[key] = { "value": value, "exp": expiration }
+        tmp_file = CREDS_CACHE_FILE.with_name(f".{CREDS_CACHE_FILE.name}.{os.getpid()}")
+        try:
+            CREDS_CACHE_FILE.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, "wb") as cf:
+                cf.write(orjson.dumps(cache))
+            os.replace(tmp_file, CREDS_CACHE_FILE)
+        except OSError:
+            pass
+    
+def run_query_date(shortname, temporal_range, token, url, to_download, search_revision, logger, use_cache=True):
     """Executes temporal range CMR query and returns S3 urls.""" 
     
     # Search for granule in test environment
-    headers = { "Authorization": f"Bearer {token}" }
     if search_revision:
         params = {
             "short_name": shortname,
             "revision_date": temporal_range,
-            "page_size": 2000
+            "page_size": CMR_PAGE_SIZE
         }
     else:
         params = {
             "short_name": shortname,
             "temporal": temporal_range,
-            "page_size": 2000
+            "page_size": CMR_PAGE_SIZE
         }
     logger.info(f"Search URL: {url}")
     logger.info(f"Search parameters: {params}")
-    res = requests.post(url=url, headers=headers, params=params)    
-    granules = res.json()
-    s3_granules = get_granule_links(to_download, granules)
+    s3_granules = search_cmr(url, token, params, to_download, logger, use_cache)
+    logger.info("Located all available granule links for search query.")
+    return s3_granules
+
+def search_cmr(url, token, params, to_download, logger, use_cache=True):
+    """Return granule links from all pages of a CMR granule search.
     
-    # Keep searching until all granules have been found
-    if "CMR-Search-After" in res.headers.keys(): 
-        search_after = res.headers["CMR-Search-After"]
-    else:
-        search_after = ""
-    while search_after:
-        logger.info("Searching for more results...")
-        headers["CMR-Search-After"] = search_after
-        
-        res = requests.post(url=url, headers=headers, params=params)    
-        granules = res.json()
-        s3_granules.extend(get_granule_links(to_download, granules))
-        if "CMR-Search-After" in res.headers.keys(): 
-            search_after = res.headers["CMR-Search-After"]
-        else:
-            search_after = ""        
+    Results are cached on disk for CMR_CACHE_TTL and reused by identical 
+    searches unless use_cache is False.
+    """ 
     
-    logger.info("Located all available granule links for search query.")
+    cache_file = cmr_cache_file(url, params, to_download)
+    if use_cache:
+        s3_granules = read_cmr_cache(cache_file)
+        if s3_granules is not None:
+            logger.info(f"Using cached CMR search results: {cache_file}.")
+            return s3_granules
+    
+    headers = { "Authorization": f"Bearer {token}" }
+    res = SESSION.post(url=url, headers=headers, params=params, stream=True)    
+    s3_granules = []
+    
+    # Keep searching until all granules have been found, requesting the next 
+    # page in the background while the current page is parsed
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        while True:
+            search_after = res.headers.get("CMR-Search-After", "")
+            if search_after:
+                logger.info("Searching for more results...")
+                next_res = executor.submit(SESSION.post, url=url, 
+                                           headers={**headers, "CMR-Search-After": search_after}, 
+                                           params=params, stream=True)
+            try:
+                s3_granules.extend(read_granule_links(res, to_download))
+            except BaseException:
+                # Release the connection held by the prefetched page
+                if search_after:
+                    next_res.add_done_callback(close_response)
+                raise
+            if not search_after:
+                break
+            res = next_res.result()
+    
+    # Failed pages raise above so only complete results are cached
+    write_cmr_cache(cache_file, s3_granules)
     return s3_granules
 
+def close_response(future):
+    """Close the response of a completed request future."""
+    
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+def cmr_cache_file(url, params, to_download):
+    """Return CMR cache file path for search parameters."""
+    
+    key = orjson.dumps({ "url": url, "params": params, "to_download": to_download },
+                       option=orjson.OPT_SORT_KEYS)
+    return CMR_CACHE_DIR.joinpath(f"{hashlib.sha1(key).hexdigest()}.json")
+
+def read_cmr_cache(cache_file):
+    """Return cached granule links or None if missing or older than 
+    CMR_CACHE_TTL."""
+    
+    try:
+        if time.time() - cache_file.stat().st_mtime > CMR_CACHE_TTL.total_seconds():
+            return None
+        return orjson.loads(cache_file.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+def write_cmr_cache(cache_file, s3_granules):
+    """Write granule links to CMR cache file."""
+    
+    tmp_file = cache_file.with_name(f".{cache_file.name}.{os.getpid()}.{threading.get_ident()}")
+    try:
+        cache_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        tmp_file.write_bytes(orjson.dumps(s3_granules))
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
 def get_granule_links(to_download, granules):
     """Return list of granule links for either https or S3."""
     
-    if to_download:
-        s3_granules = [ url["URL"] for item in granules["items"] for url in item["umm"]["RelatedUrls"] if url["Type"] == "GET DATA" ]
-    else:
-        s3_granules = [ url["URL"] for item in granules["items"] for url in item["umm"]["RelatedUrls"] if url["Type"] == "GET DATA VIA DIRECT ACCESS" ]
+    related_urls = (url for item in granules["items"] for url in item["umm"]["RelatedUrls"])
+    return filter_urls(related_urls, URL_TYPES[to_download])
+
+def read_granule_links(res, to_download):
+    """Return list of granule links from a streamed CMR response.
+    
+    Small responses are parsed whole while large or chunked responses are 
+    parsed incrementally so only the related URLs are materialized.
+    """
+    
+    with res:
+        res.raise_for_status()
+        size = int(res.headers.get("Content-Length", 0))
+        if 0 < size <= STREAM_JSON_BYTES:
+            return get_granule_links(to_download, orjson.loads(res.content))
         
-    return s3_granules
+        res.raw.decode_content = True
+        keys = set()
+        events = track_keys(ijson.parse(res.raw), keys)
+        links = filter_urls(ijson.items(events, "items.item.umm.RelatedUrls.item"), 
+                            URL_TYPES[to_download])
+    if "items" not in keys:
+        raise KeyError("items")
+    return links
+
+def track_keys(events, keys):
+    """Pass through ijson parse events and add top-level keys to keys."""
+    
+    for prefix, event, value in events:
+        if not prefix and event == "map_key":
+            keys.add(value)
+        yield prefix, event, value
+
+def filter_urls(related_urls, url_type):
+    """Return URLs of url_type from CMR UMM RelatedUrls."""
+    
+    get_type = itemgetter("Type")
+    get_url = itemgetter("URL")
+    return [ get_url(url) for url in related_urls if get_type(url) == url_type ]
       
-def run_query_name(shortname, granule_name, token, url, to_download):
+def run_query_name(shortname, granule_name, token, url, to_download, logger, use_cache=True):
     """Executes granule name CMR query and return S3 urls."""
     
-    headers = { "Authorization": f"Bearer {token}" }
     params = {
         "short_name": shortname,
-        "readable_granule_name": granule_name
+        "readable_granule_name": granule_name,
+        "page_size": CMR_PAGE_SIZE
     }
-    res = requests.post(url=url, headers=headers, params=params)        
-    granule = res.json()
-    if to_download:
-        s3_granule = [ url["URL"] for item in granule["items"] for url in item["umm"]["RelatedUrls"] if url["Type"] == "GET DATA" ]
-    else:
-        s3_granule = [ url["URL"] for item in granule["items"] for url in item["umm"]["RelatedUrls"] if url["Type"] == "GET DATA VIA DIRECT ACCESS" ]
-    
-    return s3_granule
+    return search_cmr(url, token, params, to_download, logger, use_cache)
 
-def download_files(granules, download_dir, ops_prefix, test_prefix, ops_token, test_token, logger):
-    """Download granules to download directory."""
+def download_files(granules, download_dir, ops_prefix, test_prefix, ops_token, test_token, logger, max_workers=DOWNLOAD_WORKERS):
+    """Download granules to download directory with up to max_workers 
+    concurrent downloads."""
     
     downloads = []
-    
-    # Ops
-    for granule in granules:
-        granule_name = download_dir.joinpath("ops", granule.split('/')[-1])
-        granule_name.parent.mkdir(exist_ok=True)
-        granule_url = f"{ops_prefix}/{granule}"
-        downloads.append(download(granule_url, granule_name, logger, token=ops_token))
-        
-    # Test
-    for granule in granules:
-        granule_name = download_dir.joinpath("test", granule.split('/')[-1])
-        granule_name.parent.mkdir(exist_ok=True)
-        granule_url = f"{test_prefix}/{granule}"
-        downloads.append(download(granule_url, granule_name, logger, token=test_token))
+    envs = {
+        "ops": (ops_prefix, ops_token),
+        "test": (test_prefix, test_token)
+    }
+    for env in envs:
+        download_dir.joinpath(env).mkdir(exist_ok=True)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [ executor.submit(download, f"{prefix}/{granule}", 
+                                    download_dir.joinpath(env, granule), 
+                                    logger, token=token)
+                   for env, (prefix, token) in envs.items() for granule in granules ]
+        for future in as_completed(futures):
+            downloads.append(future.result())
         
     return downloads
     
 def download(granule, granule_name, logger, token=None):
-    """Download granule."""
+    """Download granule.
+    
+    The first request asks for the leading RANGE_THRESHOLD bytes, so small 
+    granules arrive whole and any redirect is resolved by a GET. The rest of 
+    larger granules is fetched in parallel byte ranges and a failed range 
+    download is retried as a single streamed request.
+    """
     
     headers = { "Authorization": f"Bearer {token}" }
-    request = requests.get(granule, headers=headers, stream=True)
-    logger.info(f"Request headers for {granule.split('/')[-1]}: {request.headers['Content-Type']}, {request.headers['Content-Length']}")
-    with open(granule_name, "wb") as nc:
-        for chunk in request.iter_content(chunk_size=1024):
-            if chunk: nc.write(chunk)
+    request = SESSION.get(granule, headers={**headers, "Range": f"bytes=0-{RANGE_THRESHOLD - 1}"}, 
+                          stream=True)
+    size = content_range_size(request)
+    logger.info(f"Request headers for {granule_name.name}: {request.headers.get('Content-Type')}, {size or request.headers.get('Content-Length')}")
+    if size is None or size <= RANGE_THRESHOLD:
+        # The response holds the whole granule
+        write_stream(request, granule_name)
+    else:
+        # Redirected URLs are pre-signed and the token is not forwarded
+        range_headers = headers if urlsplit(request.url).netloc == urlsplit(granule).netloc else {}
+        try:
+            download_ranges(request, granule_name, size, range_headers)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Byte range download failed for {granule_name.name}, using a single request: {e}")
+            write_stream(SESSION.get(granule, headers=headers, stream=True), granule_name)
     logger.info(f"Downloaded: {granule}.")
     return granule_name
 
-def get_s3_creds(edl_creds, logger):
+def content_range_size(request):
+    """Return total size from a partial content response or None if the 
+    response is not a byte range."""
+    
+    content_range = request.headers.get("Content-Range", "")
+    if request.status_code != 206 or not content_range.startswith("bytes "):
+        return None
+    total = content_range.rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+def write_stream(request, granule_name):
+    """Write the body of a streamed response to granule_name."""
+    
+    request.raw.decode_content = True
+    with request, open(granule_name, "wb") as nc:
+        copy_stream(request.raw, nc.fileno(), 0)
+
+def download_ranges(first, granule_name, size, headers):
+    """Download granule in parallel byte ranges written into a preallocated 
+    file.
+    
+    first is the response for the leading RANGE_THRESHOLD bytes and the 
+    remaining ranges are requested from the URL it was served from.
+    """
+    
+    url = first.url
+    
+    def fetch(start):
+        end = min(start + RANGE_SIZE, size) - 1
+        with SESSION.get(url, headers={**headers, "Range": f"bytes={start}-{end}"}, stream=True) as request:
+            request.raise_for_status()
+            if request.status_code != 206:
+                raise requests.exceptions.ContentDecodingError(f"Byte range {start}-{end} not supported for: {url}.")
+            request.raw.decode_content = True
+            offset = copy_stream(request.raw, fd, start)
+        if offset != end + 1:
+            raise requests.exceptions.ContentDecodingError(f"Incomplete byte range {start}-{end} for: {url}.")
+    
+    with first:
+        # Ranges of encoded content cannot be decoded independently
+        if first.headers.get("Content-Encoding", "identity") != "identity":
+            raise requests.exceptions.ContentDecodingError(f"Byte ranges of encoded content not supported for: {url}.")
+        fd = os.open(granule_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+            with ThreadPoolExecutor(max_workers=RANGE_WORKERS) as executor:
+                futures = [ executor.submit(fetch, start) 
+                           for start in range(RANGE_THRESHOLD, size, RANGE_SIZE) ]
+                try:
+                    if copy_stream(first.raw, fd, 0) != RANGE_THRESHOLD:
+                        raise requests.exceptions.ContentDecodingError(f"Incomplete byte range 0-{RANGE_THRESHOLD - 1} for: {url}.")
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            os.close(fd)
+
+def copy_stream(stream, fd, offset):
+    """Copy urllib3 response stream into file descriptor fd starting at offset 
+    and return the offset after the last byte written.
+    
+    Unencoded responses are read into one reusable buffer. Decoded reads can
+    return more bytes than requested so encoded responses are read in chunks.
+    """
+    
+    view = memoryview(bytearray(CHUNK_SIZE))
+    encoded = stream.headers.get("Content-Encoding", "identity") != "identity"
+    while True:
+        if encoded:
+            data = memoryview(stream.read(CHUNK_SIZE))
+        else:
+            data = view[:stream.readinto(view)]
+        if not data:
+            return offset
+        written = 0
+        while written < len(data):
+            written += os.pwrite(fd, data[written:], offset + written)
+        offset += written
+
+def download_files_s3(granules, download_dir, ops_prefix, test_prefix, s3_creds, logger, max_workers=DOWNLOAD_WORKERS):
+    """Download granules directly from S3 to download directory with up to 
+    max_workers concurrent downloads."""
+    
+    from boto3.s3.transfer import TransferConfig
+    
+    downloads = []
+    config = TransferConfig(multipart_threshold=RANGE_THRESHOLD, 
+                            multipart_chunksize=RANGE_SIZE,
+                            max_concurrency=S3_CONCURRENCY)
+    envs = {
+        "ops": ops_prefix,
+        "test": test_prefix
+    }
+    clients = {}
+    for env in envs:
+        download_dir.joinpath(env).mkdir(exist_ok=True)
+        clients[env] = get_s3_client(s3_creds[env])
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [ executor.submit(download_s3, f"{prefix}/{granule}", 
+                                    download_dir.joinpath(env, granule), 
+                                    clients[env], config, logger)
+                   for env, prefix in envs.items() for granule in granules ]
+        for future in as_completed(futures):
+            downloads.append(future.result())
+        
+    return downloads
+
+def get_s3_client(creds):
+    """Return S3 client for S3 credentials, shared by all threads that use the 
+    same credentials."""
+    
+    if creds["token"] not in _S3_CLIENTS:
+        import boto3
+        from botocore.config import Config
+        _S3_CLIENTS[creds["token"]] = boto3.client("s3",
+                                                   region_name="us-west-2",
+                                                   aws_access_key_id=creds["key"],
+                                                   aws_secret_access_key=creds["secret"],
+                                                   aws_session_token=creds["token"],
+                                                   config=Config(max_pool_connections=POOL_MAXSIZE))
+    return _S3_CLIENTS[creds["token"]]
+
+def download_s3(granule, granule_name, s3_client, config, logger):
+    """Download granule from S3."""
+    
+    url = urlsplit(granule)
+    s3_client.download_file(url.netloc, url.path.lstrip("/"), 
+                            os.fspath(granule_name), Config=config)
+    logger.info(f"Downloaded: {granule}.")
+    return granule_name
+
+def get_s3_creds(logger):
     """Query SSM Parameter Store for EDL login and generate S3 credentials."""
     
-    # Request EDL creds
-    auth = f"{edl_creds['username']}:{edl_creds['password']}"
-    encoded_auth  = base64.b64encode(auth.encode('ascii'))
-    
-    # OPS creds
-    ops_response = query_s3_endpoint(S3_OPS, encoded_auth)
-    
-    # Test creds
-    test_response = query_s3_endpoint(S3_TEST, encoded_auth)
-    
-    return {
-        "ops": {
-            "key": ops_response["accessKeyId"],
-            "secret": ops_response["secretAccessKey"],
-            "token": ops_response["sessionToken"]
-        },
-        "test": {
-            "key": test_response["accessKeyId"],
-            "secret": test_response["secretAccessKey"],
-            "token": test_response["sessionToken"]
+    # Request OPS and test creds
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        ops_future = executor.submit(get_s3_endpoint_creds, S3_OPS, logger)
+        test_future = executor.submit(get_s3_endpoint_creds, S3_TEST, logger)
+        return {
+            "ops": ops_future.result(),
+            "test": test_future.result()
         }
+
+def get_s3_endpoint_creds(endpoint, logger):
+    """Return S3 credentials for endpoint, reusing credentials from memory or 
+    the credentials cache file until they are about to expire."""
+    
+    if endpoint in _S3_CREDS and _S3_CREDS[endpoint][1] - S3_CREDS_MARGIN.total_seconds() > time.time():
+        return _S3_CREDS[endpoint][0]
+    
+    entry = read_cache(endpoint, S3_CREDS_MARGIN)
+    if entry:
+        logger.info(f"Using cached S3 credentials for {endpoint}.")
+        _S3_CREDS[endpoint] = (entry["value"], entry["exp"])
+        return entry["value"]
+    
+    response = query_s3_endpoint(endpoint, get_edl_creds(logger))
+    creds = {
+        "key": response["accessKeyId"],
+        "secret": response["secretAccessKey"],
+        "token": response["sessionToken"]
     }
+    try:
+        expiration = datetime.datetime.fromisoformat(response["expiration"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        logger.info(f"No expiration returned with S3 credentials from: {endpoint}.")
+        return creds
+    _S3_CREDS[endpoint] = (creds, expiration)
+    write_cache(endpoint, creds, expiration)
+    return creds
+
+class EDLSession(requests.Session):
+    """Session that keeps EDL basic auth on redirects to and from EDL."""
     
-def query_s3_endpoint(endpoint, encoded_auth):
-    """Query S3 endpoint and return JSON response."""
+    AUTH_HOSTS = ("urs.earthdata.nasa.gov", "uat.urs.earthdata.nasa.gov")
     
-    login = requests.get(endpoint, allow_redirects=False)
-    login.raise_for_status()
+    def rebuild_auth(self, prepared_request, response):
+        """Drop Authorization header only on redirects that do not involve 
+        EDL."""
+        
+        headers = prepared_request.headers
+        if "Authorization" in headers:
+            original = urlsplit(response.request.url).hostname
+            redirect = urlsplit(prepared_request.url).hostname
+            if original != redirect and original not in self.AUTH_HOSTS \
+                and redirect not in self.AUTH_HOSTS:
+                del headers["Authorization"]
+    
+def query_s3_endpoint(endpoint, edl_creds):
+    """Query S3 endpoint and return JSON response.
+    
+    The endpoint redirects to EDL which authenticates and redirects back with 
+    the access token cookie stored by the session.
+    """
     
-
-    auth_redirect = requests.post(
-        login.headers['location'],
-        data = {"credentials": encoded_auth},
-        headers= { "Origin": endpoint },
-        allow_redirects=False
-    )
-    auth_redirect.raise_for_status()
-    final = requests.get(auth_redirect.headers['location'], allow_redirects=False)
-    results = requests.get(endpoint, cookies={'accessToken': final.cookies['accessToken']})
+    # Share the pooled adapter and keep cookies separate per endpoint; the 
+    # session is not closed as that would close the shared adapter
+    session = EDLSession()
+    session.mount("https://", SESSION.get_adapter("https://"))
+    session.headers["Authorization"] = edl_creds["authorization"]
+    results = session.get(endpoint, allow_redirects=True)
     results.raise_for_status()
-    response = json.loads(results.content)
+    response = orjson.loads(results.content)
     return response
 
+def positive_int(value):
+    """Return value as an integer or raise an argparse error if it is less 
+    than 1."""
+    
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {number}")
+    return number
+
 def create_args():
     """Create and return argparser with arguments."""
 
@@ -363,6 +830,10 @@ def create_args():
                             "--download",
                             action='store_true',
                             help="Indicates that NetCDF files should be downloaded")
+    arg_parser.add_argument("-a",
+                            "--s3download",
+                            action='store_true',
+                            help="Indicates that NetCDF files should be downloaded directly from S3 (requires running in us-west-2)")
     arg_parser.add_argument("-t",
                             "--delete",
                             action='store_true',
@@ -388,6 +859,15 @@ def create_args():
                             "--html",
                             action='store_true',
                             help="Write HTML files to display report instead of txt")
+    arg_parser.add_argument("-m",
+                            "--max-concurrency",
+                            type=positive_int,
+                            default=DOWNLOAD_WORKERS,
+                            help="Maximum number of concurrent granule downloads")
+    arg_parser.add_argument("-n",
+                            "--no-cache",
+                            action='store_true',
+                            help="Always query CMR instead of reusing recently cached search results")
     arg_parser.add_argument("-p",
                             "--htmldir",
                             type=str,
@@ -400,8 +880,20 @@ def get_logger(log_file):
     
     # Create a Logger object and set log level
     logger = logging.getLogger(__name__)
+    
+    # Reuse logger already writing to log file and replace handlers for any
+    # other log file so messages are not emitted more than once
+    log_path = os.path.abspath(log_file)
+    if any(getattr(handler, "baseFilename", None) == log_path for handler in logger.handlers):
+        return logger
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    
     logger.setLevel(logging.DEBUG)
-    log_format = logging.Formatter("%(asctime)s - %(module)s - %(levelname)s : %(message)s")
+    logger.propagate = False
+    log_format = logging.Formatter("%(asctime)s - %(module)s - %(levelname)s : %(message)s",
+                                   datefmt="%Y-%m-%dT%H:%M:%S")
 
     # Create a handler to console and set level and format
     console_handler = logging.StreamHandler()
@@ -431,7 +923,10 @@ def compare_handler():
     granule_name = args.granulename
     start_time = args.startdate
     end_time = args.enddate
-    to_download = args.download
+    s3_download = args.s3download
+    max_concurrency = args.max_concurrency
+    use_cache = not args.no_cache
+    to_download = args.download or s3_download
     download_dir = pathlib.Path(args.downloaddir)
     report_dir = pathlib.Path(args.reportdir)
     log_dir = pathlib.Path(args.logdir)
@@ -445,11 +940,13 @@ def compare_handler():
     report_dir.mkdir(parents=True, exist_ok=True)
     log_dir.mkdir(parents=True, exist_ok=True)
     
-    # Logging
+    # Run date used for the log file and reports
     if start_time:
         date_str = datetime.datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S").strftime("%Y%m%dT%H%M%S")
     else:
         date_str = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    
+    # Logging
     log_file = log_dir.joinpath(f"{shortname}_{date_str}.log")
     logger = get_logger(log_file)
     
@@ -461,39 +958,40 @@ def compare_handler():
         sys.exit(1)
     
     if granule_name:
-        compare.query_name(shortname, granule_name, to_download)
+        compare.query_name(shortname, granule_name, to_download and not s3_download, use_cache)
     else:
-        compare.query_date(shortname, start_time, end_time, to_download, search_revision, logger)
+        compare.query_date(shortname, start_time, end_time, to_download and not s3_download, search_revision, logger, use_cache)
         
     if len(compare.ops_granules) == 0 and len(compare.test_granules) > 0:
         logger.info("No granules were found in ops.")
         logger.info(f"# of test granules: {len(compare.test_granules)}.")
-        compare.write_reports(report_dir, html_dir, shortname, start_time, create_html)
+        compare.write_reports(report_dir, html_dir, shortname, start_time, create_html, date_str=date_str)
         logger.info("Cannot compare. Exit.")
         sys.exit(0)
         
     elif len(compare.test_granules) == 0 and len(compare.ops_granules) > 0:
         logger.info("No granules were found in test.")
         logger.info(f"# of ops granules: {len(compare.ops_granules)}.")
-        compare.write_reports(report_dir, html_dir, shortname, start_time, create_html)
+        compare.write_reports(report_dir, html_dir, shortname, start_time, create_html, date_str=date_str)
         logger.info("Cannot compare. Exit.")
         sys.exit(0)
         
     elif len(compare.ops_granules) == 0 and len(compare.test_granules) == 0:
         logger.info("No ops or test granules were found.")
         logger.info("Cannot compare. Exit.")
-        compare.write_reports(report_dir, html_dir, shortname, start_time, create_html)
+        compare.write_reports(report_dir, html_dir, shortname, start_time, create_html, date_str=date_str)
         sys.exit(0)
     
     else:
+        import botocore
         try:
-            compare.compare_granules(to_download, download_dir)
+            compare.compare_granules(to_download, download_dir, s3_download, max_concurrency)
         except botocore.exceptions.ClientError as e:
             logger.error(f"Error - {e}")
             logger.error("Encountered error while trying to compare granules. Exit.")
             sys.exit(1)
         
-        compare.write_reports(report_dir, html_dir, shortname, start_time, create_html, netcdf=True)
+        compare.write_reports(report_dir, html_dir, shortname, start_time, create_html, netcdf=True, date_str=date_str)
     
     if to_delete:
         compare.delete_downloads()
@@ -16,73 +16,116 @@ test granules:
 """
 
 # Standard imports 
-from collections import OrderedDict
 import datetime
-import json
+import errno
+import functools
+import io
 import os
 import pathlib
+import re
 import shutil
+import types
 
-# Local imports
-from netcdf import write_netcdf_report
+# Third-party imports
+import orjson
+
+# The local netcdf module is imported where it is used so reports without a 
+# NetCDF comparison do not load netCDF4, h5py and NumPy
 
 # Constants
-DATASET_DICT = {
+DATASET_DICT = types.MappingProxyType({
     "MODIS_A-JPL-L2P-v2019.0": "aqua",
     "MODIS_T-JPL-L2P-v2019.0": "terra",
     "VIIRS_NPP-JPL-L2P-v2016.2": "viirs"
-}
+})
+TXT_ITEM = "\t\t{}\n"
+HTML_ITEM = "<li>{}</li>\n"
+WRITE_BUFFER = 256 << 10    # Buffer size for HTML pages written in pieces
+# Page header and nav bar
+HTML_HEADER = (
+    "<!DOCTYPE html>\n<html>\n<head>\n<link rel='stylesheet' href='style.css'>\n</head>\n<body>\n"
+    "<ul class='nav'>\n"
+    "<li class='nav'><a href='index.html'>Home</a></li>\n"
+    "<li class='nav'><a href='index-{dataset}.html'>Overview</a></li>\n"
+    "<li class='nav'><a href='timeline-{dataset}.html'>Timeline</a></li>\n"
+    "<li class='nav'><a href='detail-reports-{dataset}.html'>Detail Reports</a></li>\n"
+    "<li class='nav'><a href='archive-{dataset}.html'>Archive</a></li>\n"
+    "</ul>\n"
+)
+# Links in nav bar and to detail reports that move down a level when archived
+RELATIVE_HREF = re.compile(r"(<li class='nav'><a href='|<a href='(?=detail-reports/))")
+
+def format_date(start_time):
+    """Return report date string for start_time or the current time."""
+    
+    if start_time:
+        return _fmt_date(start_time)
+    return datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+
+@functools.lru_cache(maxsize=128)
+def _fmt_date(start_time):
+    """Convert start_time to a report date string."""
+    
+    return datetime.datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S").strftime("%Y%m%dT%H%M%S")
+
+def format_list(elements, item):
+    """Format each element with item template and join the results."""
+    
+    return "".join(map(item.format, elements))
 
 def write_txt_report(report_dir, shortname, start_time, ops_granules, 
                      test_granules, granule_diffs, netcdf_data, logger, 
-                     netcdf=False):
+                     netcdf=False, date_str=None):
     """Write report on comparisons between ops and test files."""
     
-    if start_time:
-        date_str = datetime.datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S").strftime("%Y%m%dT%H%M%S")
-    else:
-        date_str = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
-    report_file = report_dir.joinpath(f"report_{DATASET_DICT[shortname]}_{date_str}.txt")
+    dataset = DATASET_DICT[shortname]
+    date_str = date_str or format_date(start_time)
+    report_file = report_dir.joinpath(f"report_{dataset}_{date_str}.txt")
+    ops_num, test_num = len(ops_granules), len(test_granules)
     
     # Write granule differences
-    with open(report_file, 'w') as rf:
-        rf.write(f"===== Granule Report for {shortname} =====\n")
-        rf.write("\n<<<< OPS vs. Test Granule Differences >>>>\n")
-        rf.write(f"\tNumber of granules in ops: {len(ops_granules)}.\n")
-        rf.write(f"\tNumber of granules in test: {len(test_granules)}.\n")
+    parts = [
+        f"===== Granule Report for {shortname} =====\n",
+        "\n<<<< OPS vs. Test Granule Differences >>>>\n",
+        f"\tNumber of granules in ops: {ops_num}.\n",
+        f"\tNumber of granules in test: {test_num}.\n"
+    ]
 
-        # Write out differences in granules
-        if len(granule_diffs["ops_only"]) > 0:
-            rf.write("\n\t----------------------------------------------------------------------------------\n")
-            rf.write("\tGranules in OPS only:\n")
-            for granule in granule_diffs["ops_only"]: rf.write(f"\t\t{granule}\n")
-            
-        if len(granule_diffs["test_only"]) > 0:
-            rf.write("\n\t----------------------------------------------------------------------------------\n")
-            rf.write("\tGranules in Test only:\n")
-            for granule in granule_diffs["test_only"]: rf.write(f"\t\t{granule}\n")
+    # Write out differences in granules
+    if len(granule_diffs["ops_only"]) > 0:
+        parts.append("\n\t----------------------------------------------------------------------------------\n")
+        parts.append("\tGranules in OPS only:\n")
+        parts.append(format_list(granule_diffs["ops_only"], TXT_ITEM))
         
-        # Write out granules that were found if not writing NetCDF comparison
-        if not netcdf:
-            if len(ops_granules) > 0:
-                rf.write("\n\tAll Granules in OPS:\n")
-                for granule in ops_granules: rf.write(f"\t\t{granule}\n")
-            if len(test_granules) > 0:
-                rf.write("\n\tAll Granules in Test:\n")
-                for granule in test_granules: rf.write(f"\t\t{granule}\n")
-                
-        rf.write("\n======================================================================================\n")
+    if len(granule_diffs["test_only"]) > 0:
+        parts.append("\n\t----------------------------------------------------------------------------------\n")
+        parts.append("\tGranules in Test only:\n")
+        parts.append(format_list(granule_diffs["test_only"], TXT_ITEM))
+    
+    # Write out granules that were found if not writing NetCDF comparison
+    if not netcdf:
+        if ops_num > 0:
+            parts.append("\n\tAll Granules in OPS:\n")
+            parts.append(format_list(ops_granules, TXT_ITEM))
+        if test_num > 0:
+            parts.append("\n\tAll Granules in Test:\n")
+            parts.append(format_list(test_granules, TXT_ITEM))
+            
+    parts.append("\n======================================================================================\n")
+    report_file.write_text("".join(parts))
     
     # Write results of NetCDF comparison
     granule_data = {}
     if netcdf:
+        from netcdf import write_netcdf_report
         granule_data = write_netcdf_report(netcdf_data, report_file, shortname)
         
     logger.info(f"Report written: {report_file}.")
     return granule_data
     
 def write_html_reports(html_dir, shortname, report_dir, start_time, ops_granules, 
-                       test_granules, granule_diffs, granule_data, logger):
+                       test_granules, granule_diffs, granule_data, logger,
+                       date_str=None):
     """Write report in HTML format to html_dir which points to a hosted
     web space."""
     
@@ -92,23 +135,17 @@ def write_html_reports(html_dir, shortname, report_dir, start_time, ops_granules
     setup_html(html_dir, report_dir, logger)
     
     # HTML report name
-    if start_time:
-        date_str = datetime.datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S").strftime("%Y%m%dT%H%M%S")
-    else:
-        date_str = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    date_str = date_str or format_date(start_time)
         
     # Write overview of granule differences
     html_file = html_dir.joinpath(f"index-{dataset}-new.html")
-    html_fh = open(html_file, 'w')
+    html_fh = io.StringIO()
     write_html_header(html_fh, dataset)
     logger.info("Wrote HTML header for hourly page.")
 
     nc_not_equal = check_not_equal_status(granule_data, len(ops_granules), len(test_granules))
     no_granule_data = True if not granule_data else False
-    if "report_file" in granule_data.keys(): 
-        report_file = granule_data["report_file"]
-    else:
-        report_file = None
+    report_file = granule_data.get("report_file")
     write_html_overview(date_str, html_fh, ops_granules, test_granules, 
                         report_file)
     logger.info("Wrote HTML overview table and stats for hourly page.")
@@ -123,9 +160,9 @@ def write_html_reports(html_dir, shortname, report_dir, start_time, ops_granules
                         test_granules, nc_not_equal)
     logger.info("Wrote list of differences to overview hourly page.")
         
-    # Close file
+    # Write file
     html_fh.write("</body>")
-    html_fh.close()
+    html_file.write_bytes(html_fh.getvalue().encode("utf-8"))
     logger.info(f"Completed overview and granule level HTML report for: {date_str}.")
     
     # Archive previous report and replace with current
@@ -153,50 +190,40 @@ def setup_html(html_dir, report_dir, logger):
     # Detailed reports
     detail_reports = html_dir.joinpath("detail-reports")
     detail_reports.mkdir(parents=True, exist_ok=True)
+    join, replace = detail_reports.joinpath, os.replace
     with os.scandir(report_dir) as entries:
-        for entry in entries: shutil.move(entry, detail_reports.joinpath(entry.name))
+        for entry in entries:
+            try:
+                replace(entry.path, join(entry.name))
+            except OSError as error:
+                if error.errno != errno.EXDEV: raise
+                shutil.move(entry.path, join(entry.name))
     logger.info(f"Moved all NetCDF detail reports to: {detail_reports}.")
     
     # Stylesheet
     css = pathlib.Path(os.path.dirname(__file__)).joinpath("html_files", "style.css")
-    shutil.copy(css, html_dir.joinpath(css.name))
+    css_bytes = css.read_bytes()
+    html_dir.joinpath(css.name).write_bytes(css_bytes)
     logger.info(f"Copied css file to web directory: {html_dir.joinpath(css.name)}.")
     
-    shutil.copy(css, html_dir.joinpath("archive", css.name))
+    archive.joinpath(css.name).write_bytes(css_bytes)
     logger.info(f"Copied css file to archive directory: {html_dir.joinpath('archive', css.name)}.")
     
     # HTML
     html = pathlib.Path(os.path.dirname(__file__)).joinpath("html_files", "index.html")
-    shutil.copy(html, html_dir.joinpath(html.name))
+    shutil.copyfile(html, html_dir.joinpath(html.name))
     logger.info(f"Copied html file to web directory: {html_dir.joinpath(html.name)}.")
     
 def write_html_header(html_file, dataset):
     
-    # Header
-    html_file.write("<!DOCTYPE html>\n<html>\n<head>\n<link rel='stylesheet' href='style.css'>\n</head>\n<body>\n")
-    
-    # Nav bar
-    html_file.write("<ul class='nav'>\n")
-    html_file.write("<li class='nav'><a href='index.html'>Home</a></li>\n")
-    html_file.write(f"<li class='nav'><a href='index-{dataset}.html'>Overview</a></li>\n")
-    html_file.write(f"<li class='nav'><a href='timeline-{dataset}.html'>Timeline</a></li>\n")
-    html_file.write(f"<li class='nav'><a href='detail-reports-{dataset}.html'>Detail Reports</a></li>\n")
-    html_file.write(f"<li class='nav'><a href='archive-{dataset}.html'>Archive</a></li>\n")
-    html_file.write("</ul>\n")
+    html_file.write(HTML_HEADER.format(dataset=dataset))
     
 def check_not_equal_status(granule_data, ops_num, uat_num):
     """Check if an error was encountered or all NetCDF files were the same."""
     
-    if "nc_not_equal" in granule_data.keys():
-        nc_not_equal = granule_data["nc_not_equal"]
-    elif not granule_data:
-        if ops_num == 0 and uat_num == 0:
-            nc_not_equal = []
-        else:
-            nc_not_equal = ["Error"]
-    else:
-        nc_not_equal = []
-    return nc_not_equal
+    if not granule_data:
+        return [] if ops_num == 0 and uat_num == 0 else ["Error"]
+    return granule_data.get("nc_not_equal", [])
     
 def write_html_overview(date_str, html_file, ops_granules, test_granules, 
                         report_file):
@@ -217,31 +244,22 @@ def write_html_overview(date_str, html_file, ops_granules, test_granules,
 def write_html_list(html_file, data):
     """Write out an unorder HTML list."""
     
-    html_file.write("<ul>\n")
-    for element in data: html_file.write(f"<li>{element}</li>\n")
-    html_file.write("</ul>\n")
+    html_file.write(f"<ul>\n{format_list(data, HTML_ITEM)}</ul>\n")
         
 def write_granule_html(html_fh, granule_data):
     """Generate HTML table of granule-level comparison details."""
     
     columns = ["Granule", "OPS Creation Time", "UAT Creation Time", "Global Attribue Equality", "Dimension Equality", "Variable Equality", "Report File"]
     table_head = f"<thead>\n<tr><th>{'</th><th>'.join(columns)}</th>\n</tr>\n</thead>\n"
-    table_body = "<tbody>\n"
+    parts = ["<tbody>\n"]
     report_file = granule_data['report_file']
     for granule, data in granule_data["granules"].items():
-        equal = is_equal(data)
-        if not equal:
-            table_body += f"<tr class='not_equal'>"
-        else:
-            table_body += f"<tr>"
-        table_body += f"<td>{granule}</td>"
-        table_body += f"<td>{data['ops_date']}</td>"
-        table_body += f"<td>{data['uat_date']}</td>"
-        table_body+= f"<td>{data['equal_atts']}</td>"
-        table_body+= f"<td>{data['equal_dims']}</td>"
-        table_body+= f"<td>{data['equal_vars']}</td>"
-        table_body+= f"<td><a href='detail-reports/{report_file}' target='_blank'>{report_file}</a></td></tr>\n"
-    table_body+= "</tbody>\n"
+        row = "<tr>" if is_equal(data) else "<tr class='not_equal'>"
+        parts.append(f"{row}<td>{granule}</td><td>{data['ops_date']}</td><td>{data['uat_date']}</td>"
+                     f"<td>{data['equal_atts']}</td><td>{data['equal_dims']}</td><td>{data['equal_vars']}</td>"
+                     f"<td><a href='detail-reports/{report_file}' target='_blank'>{report_file}</a></td></tr>\n")
+    parts.append("</tbody>\n")
+    table_body = "".join(parts)
     
     html_fh.write("<h2>Granule-Level Comparison</h2>\n")
     html_fh.write(f"<table>\n{table_head}{table_body}</table>\n")
@@ -274,19 +292,12 @@ def write_overview_list(html_file, no_granule_data, granule_diffs, ops_granules,
     if len(nc_not_equal) > 0:
         if nc_not_equal[0] != "Error":
             html_file.write("<h2>Unequal NetCDF Granules: </h2>\n")
-            html_file.write("<ul>\n")
-            for granule in nc_not_equal: html_file.write(f"<li>{granule}</li>\n")
-            html_file.write("</ul>\n")
+            write_html_list(html_file, nc_not_equal)
         
 def is_equal(granule_data):
     """Determine if granule is not equal between OPS and UAT."""
     
-    is_equal = True
-    for value in granule_data.values():
-        if not value:
-            is_equal = False
-            break
-    return is_equal
+    return all(granule_data.values())
 
 def archive_html_report(html_dir, dataset, logger):
     """Place previous report in archive directory named after date string."""
@@ -297,9 +308,10 @@ def archive_html_report(html_dir, dataset, logger):
     if previous_index.exists():
         # Get date string
         with open(previous_index) as html_fh:
-            for line in html_fh.readlines(): 
+            for line in html_fh: 
                 if line.startswith("<h1>"):
-                    date_str = line.split("<h1>")[-1].split(' ')[0]
+                    date_str = line[4:].split(' ', 1)[0]
+                    break
     
         # Rename and move to archive directory
         archive_index = html_dir.joinpath("archive", f"{date_str}-{dataset}.html")
@@ -325,32 +337,24 @@ def write_dir_listing(dir, title, html_dir, dataset, logger):
         
     # Open HTML file and write header plus title
     html_file = html_dir.joinpath(f"{dir.name}-{dataset}.html")
-    html_fh = open(html_file, 'w')
-    write_html_header(html_fh, dataset)
-    html_fh.write(f"<h1>{title}</h2>\n")
-    
-    # Write out list of links to directory files
-    html_fh.write("<ul>\n")
-    for file in dir_list: 
-        if file == "style.css": continue
-        html_fh.write(f"<li><a href='{dir.name}/{file}' target='_blank'>{file}</a></li>\n")
-    html_fh.write("</ul>\n")
+    with open(html_file, 'w', buffering=WRITE_BUFFER) as html_fh:
+        write_html_header(html_fh, dataset)
+        html_fh.write(f"<h1>{title}</h2>\n")
+        
+        # Write out list of links to directory files
+        html_fh.write("<ul>\n")
+        for file in dir_list: 
+            if file == "style.css": continue
+            html_fh.write(f"<li><a href='{dir.name}/{file}' target='_blank'>{file}</a></li>\n")
+        html_fh.write("</ul>\n")
     
     logger.info(f"Wrote HTML page for {title}.")
 
 def update_nav(archive_index):
     """Update navigation bar for archived page."""
     
-    with open(archive_index) as fh:
-        archive_data = fh.read().splitlines()
-     
-    for i in range(len(archive_data)):
-        if "class='nav'" in archive_data[i] or "<h3><a href='detail-reports/" in archive_data[i] or "<a href='detail-reports/report" in archive_data[i]:
-            archive_data[i] = archive_data[i].replace("href='", "href='../") 
-    
-    archive_data = '\n'.join(archive_data)
-    with open(archive_index, 'w') as fh:
-        fh.write(archive_data)
+    archive_data = archive_index.read_text()
+    archive_index.write_text(RELATIVE_HREF.sub(r"\1../", archive_data))
 
 def write_timeline_html(html_dir, dataset, date_str, ops_granules, 
                         test_granules, nc_not_equal, archive_file, logger):
@@ -361,13 +365,12 @@ def write_timeline_html(html_dir, dataset, date_str, ops_granules,
     json_file.parent.mkdir(parents=True, exist_ok=True)
     previous_data = {}
     if json_file.exists():
-        with open(json_file) as jf:
-            previous_data = json.load(jf)
-        previous_data = OrderedDict(sorted(previous_data.items(), reverse=True))
+        previous_data = orjson.loads(json_file.read_bytes())
+        previous_data = dict(sorted(previous_data.items(), reverse=True))
         
     # Create page
     html_file = html_dir.joinpath(f"timeline-{dataset}.html")
-    html_fh = open(html_file, 'w')
+    html_fh = io.StringIO()
     write_html_header(html_fh, dataset)
     logger.info(f"Wrote header for timeline page of historic data.")    
     
@@ -397,9 +400,9 @@ def write_timeline_html(html_dir, dataset, date_str, ops_granules,
                         ops_granules, test_granules, nc_not_equal)
     logger.info(f"Wrote timeline JSON: {json_file}.")
     
-    # Close file
+    # Write file
     html_fh.write("</body>")
-    html_fh.close()
+    html_file.write_bytes(html_fh.getvalue().encode("utf-8"))
     logger.info(f"Completed timeline page for historic date: {html_file}.")
     
 def write_current_timeline(table_body, dataset, date_str, ops_granules, 
@@ -407,16 +410,12 @@ def write_current_timeline(table_body, dataset, date_str, ops_granules,
     """Write current data to timeline table."""
         
     is_equal = len(nc_not_equal) == 0
-    if is_equal:
-        table_body += f"<tr>"
-    else:
-        table_body += f"<tr class='not_equal'>"
-    table_body += f"<td>{date_str}</td>"
-    table_body += f"<td>{len(ops_granules)}</td>"
-    table_body += f"<td>{len(test_granules)}</td>"
-    table_body+= f"<td>{is_equal}</td>"
-    table_body+= f"<td><a href='index-{dataset}.html'>Current</a></td></tr>\n"
-    return table_body
+    row = "<tr>" if is_equal else "<tr class='not_equal'>"
+    return "".join([
+        table_body,
+        f"{row}<td>{date_str}</td><td>{len(ops_granules)}</td><td>{len(test_granules)}</td>"
+        f"<td>{is_equal}</td><td><a href='index-{dataset}.html'>Current</a></td></tr>\n"
+    ])
     
 def write_previous_timeline(table_body, previous_data, archive_file):
     """Display previous data in a table."""
@@ -427,17 +426,13 @@ def write_previous_timeline(table_body, previous_data, archive_file):
             previous_data[hour]['archive'] = archive_file.name
     
     # Format table
+    parts = [table_body]
     for hour, data in previous_data.items():
-        if not data['equality']:
-            table_body += f"<tr class='not_equal'>"
-        else:
-            table_body += f"<tr>"
-        table_body += f"<td>{hour}</td>"
-        table_body += f"<td>{data['num_ops']}</td>"
-        table_body += f"<td>{data['num_uat']}</td>"
-        table_body+= f"<td>{data['equality']}</td>"
-        table_body+= f"<td><a href='archive/{data['archive']}' target='_blank'>{data['archive']}</a></td></tr>\n"
-    return table_body
+        row = "<tr>" if data['equality'] else "<tr class='not_equal'>"
+        parts.append(f"{row}<td>{hour}</td><td>{data['num_ops']}</td><td>{data['num_uat']}</td>"
+                     f"<td>{data['equality']}</td>"
+                     f"<td><a href='archive/{data['archive']}' target='_blank'>{data['archive']}</a></td></tr>\n")
+    return "".join(parts)
     
 def write_timeline_json(html_dir, dataset, previous_data, date_str, 
                         ops_granules, test_granules, nc_not_equal):
@@ -460,5 +455,4 @@ def write_timeline_json(html_dir, dataset, previous_data, date_str,
             }
         }
     json_file = html_dir.joinpath("json", f"timeline-{dataset}.json")
-    with open(json_file, 'w') as jf:
-        json.dump(previous_data, jf, indent=2)
\ No newline at end of file
+    json_file.write_bytes(orjson.dumps(previous_data, option=orjson.OPT_INDENT_2))
\ No newline at end of file
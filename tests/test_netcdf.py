@@ -0,0 +1,59 @@
+"""Regression tests for NetCDF comparisons."""
+
+# Standard imports
+import pathlib
+import sys
+
+# Third-party imports
+import h5py
+from netCDF4 import Dataset
+import numpy as np
+
+# Local imports
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1].joinpath("compare")))
+from netcdf import compare_variables
+
+def write_granule(path, words, start=0):
+    """Write a granule with chunked variable-length string and ragged integer 
+    variables."""
+    
+    with Dataset(path, mode="w") as ds:
+        ds.createDimension("x", len(words))
+        names = ds.createVariable("names", str, ("x",), chunksizes=(2,))
+        ragged_t = ds.createVLType(np.int32, "ragged_t")
+        ragged = ds.createVariable("ragged", ragged_t, ("x",), chunksizes=(2,))
+        for i, word in enumerate(words):
+            names[i] = word
+            ragged[i] = np.arange(start, start + i + 1, dtype=np.int32)
+
+def compare_granules(dev_path, prod_path):
+    """Return variable comparison of two granules using raw chunk access."""
+    
+    with Dataset(dev_path, mode="r") as dev_ds, Dataset(prod_path, mode="r") as prod_ds, \
+        h5py.File(dev_path, "r") as dev_h5, h5py.File(prod_path, "r") as prod_h5:
+        return compare_variables(dev_ds, prod_ds, (dev_h5, prod_h5))["var_content"]
+
+def test_vlen_strings_with_different_contents(tmp_path):
+    dev_path, prod_path = tmp_path.joinpath("dev.nc"), tmp_path.joinpath("prod.nc")
+    write_granule(dev_path, [ f"alpha{i}" for i in range(4) ])
+    write_granule(prod_path, [ f"bravo{i}" for i in range(4) ])
+    
+    assert compare_granules(dev_path, prod_path)["names"]["arrays_equal"] is False
+
+def test_vlen_strings_with_same_contents(tmp_path):
+    dev_path, prod_path = tmp_path.joinpath("dev.nc"), tmp_path.joinpath("prod.nc")
+    write_granule(dev_path, [ f"alpha{i}" for i in range(4) ])
+    write_granule(prod_path, [ f"alpha{i}" for i in range(4) ])
+    
+    var_content = compare_granules(dev_path, prod_path)
+    assert var_content["names"]["arrays_equal"] is True
+    assert var_content["ragged"]["arrays_equal"] is True
+
+def test_ragged_vlen_with_different_contents(tmp_path):
+    dev_path, prod_path = tmp_path.joinpath("dev.nc"), tmp_path.joinpath("prod.nc")
+    write_granule(dev_path, [ f"alpha{i}" for i in range(4) ])
+    write_granule(prod_path, [ f"alpha{i}" for i in range(4) ], start=1)
+    
+    var_content = compare_granules(dev_path, prod_path)
+    assert var_content["ragged"]["arrays_equal"] is False
+    assert var_content["names"]["arrays_equal"] is True